@@ -1,36 +1,175 @@
 import re
 import json
+import atexit
+import functools
+import signal
+import sys
 import time
+import threading
 import urllib.request
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from itertools import chain
 from deep_translator import GoogleTranslator
 from tqdm import tqdm
 import os
 import html
 
+try:
+    import orjson  # much faster C serializer for the large cache files
+except ImportError:
+    orjson = None
+
+try:
+    import re2  # RE2: linear-time scanning, no backtracking across the alternation
+except ImportError:
+    re2 = None
+
 INPUT_FILE = "publics.pwn"
 OUTPUT_FILE = "lrp_translated.pwn"
 CACHE_FILE = "translation_cache.json"
+CACHE_JOURNAL = CACHE_FILE + ".jsonl"
 FAILED_LOG = "failed_translations.txt"
 BATCH_SIZE = 20
+TRANSLATE_CHUNK_SIZE = 50
+WORKERS = 8  # concurrent translation requests; keep bounded to avoid rate-limiting
 USE_LIMIT = True
 TRANSLATION_LIMIT = 5000
 
+_RUSSIAN_RE = re.compile(r'[а-яА-ЯёЁ]')
+
+_CODE_PATTERN = (
+    r"(\{[\w#]+\})"              # (1) {COLOR} codes
+    r"|(\%[-.\d]*[sdifucU\%])"  # (2) Format specifiers (%s, %d)
+    r"|(\\[ntbrfva\"'\\{} ])"    # (3) Pawn escape sequences (\n, \t, \\)
+    r"|(\\\r?\n)"                # (4) C-style line continuation
+    r"|(\s{2,})"                 # (5) Multiple spaces
+    r"|(\r)"                     # (6) Standalone carriage return
+    r"|(\n)"                     # (7) Standalone newline
+)
+
+# The splitter is the hottest pattern; prefer RE2's DFA over re's backtracking
+# NFA when the binding is installed (the API is a drop-in subset of re).
+if re2 is not None:
+    try:
+        _CODE_RE = re2.compile(_CODE_PATTERN)
+    except Exception:
+        _CODE_RE = re.compile(_CODE_PATTERN)
+else:
+    _CODE_RE = re.compile(_CODE_PATTERN)
+
+# split() interleaves text and the capturing groups: tokens at indices that
+# are multiples of groups+1 are text, everything else is a matched code.
+_CODE_SLOTS = _CODE_RE.groups + 1
+
+# Post-processing patterns applied to every reconstructed string. The
+# newline collapse consumes every newline (plus surrounding whitespace and a
+# leading continuation backslash), which also subsumes trailing-space cleanup.
+_NEWLINE_COLLAPSE_RE = re.compile(r'\\?\s*\r?\n\s*')
+# Both format-specifier spacing rules (letter before %spec, letter after) in a
+# single pattern, so each reconstructed string is scanned once instead of twice.
+# The adjacent letters are matched via lookaround so they stay available to the
+# neighbouring match (e.g. the letter between two specifiers in "a%sb").
+_FMT_RE = re.compile(r'((?<=[a-zA-Zа-яА-ЯёЁ]))?(%[-.\d]*[sdifucU%])((?=[a-zA-Zа-яА-ЯёЁ]))?')
+
+# One token of the Pawn-escaping pass: a valid escape pair, a lone backslash,
+# or a bare double quote. Alternation order matters — pairs are consumed first
+# so their second character is never re-examined.
+_PAWN_ESCAPE_RE = re.compile(r'\\[ntbrfva"\'\\%{} ]|\\|"')
+
+def _pawn_escape_token(match):
+    token = match.group(0)
+    if len(token) == 2:
+        # Already a valid Pawn escape sequence (\n, \t, \\, ...), keep as is.
+        return token
+    # A literal backslash not starting a recognized escape must be doubled;
+    # a bare double quote must be escaped.
+    return '\\\\' if token == '\\' else '\\"'
+
+def _pawn_escape(text):
+    return _PAWN_ESCAPE_RE.sub(_pawn_escape_token, text)
+
+def _fmt_spacing(match):
+    spec = match.group(2)
+    if match.group(1) is not None:
+        spec = " " + spec
+    if match.group(3) is not None:
+        spec = spec + " "
+    return spec
+
 def load_json_file(filepath, default_data={}):
     try:
         if not os.path.exists(filepath):
             return default_data
+        if orjson is not None:
+            with open(filepath, "rb") as f:
+                return orjson.loads(f.read())
         with open(filepath, "r", encoding="utf-8") as f:
             return json.load(f)
-    except (FileNotFoundError, json.JSONDecodeError):
+    except (FileNotFoundError, ValueError):
         print(f"Warning: Cache file '{filepath}' not found or corrupted. Starting with empty cache.")
         return default_data
 
 def save_json_file(filepath, data):
-    with open(filepath, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=4)
-
+    # Write to a sidecar and rename so an interrupted save cannot corrupt the cache.
+    tmp_path = filepath + ".tmp"
+    if orjson is not None:
+        with open(tmp_path, "wb") as f:
+            f.write(orjson.dumps(data))
+    else:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp_path, filepath)
+
+def append_cache_journal(entries):
+    # Persist only the entries added since the last flush, as JSON Lines,
+    # instead of rewriting the whole cache file on every batch.
+    if not entries:
+        return
+    with open(CACHE_JOURNAL, "a", encoding="utf-8") as f:
+        for key, value in entries.items():
+            f.write(json.dumps({key: value}, ensure_ascii=False) + "\n")
+
+def replay_cache_journal(cache):
+    # Apply journal entries left over from previous runs on top of the base cache.
+    if not os.path.exists(CACHE_JOURNAL):
+        return cache
+    with open(CACHE_JOURNAL, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                cache.update(json.loads(line))
+            except json.JSONDecodeError:
+                continue  # a torn last line from an interrupted run
+    return cache
+
+def compact_cache(cache):
+    # Fold the journal into the base cache file and remove it.
+    save_json_file(CACHE_FILE, cache)
+    if os.path.exists(CACHE_JOURNAL):
+        os.remove(CACHE_JOURNAL)
+
+_thread_local = threading.local()
+
+# Set by the SIGINT handler so worker threads stuck in retries or waiting for
+# the internet bail out promptly instead of blocking executor shutdown.
+_shutdown_event = threading.Event()
+
+def get_translator():
+    # Reuse one GoogleTranslator per worker thread instead of constructing a
+    # fresh one on every attempt of every call.
+    translator = getattr(_thread_local, "translator", None)
+    if translator is None:
+        translator = GoogleTranslator(source='ru', target='en')
+        _thread_local.translator = translator
+    return translator
+
+@functools.lru_cache(maxsize=200_000)
 def contains_russian(text):
-    return re.search(r'[а-яА-ЯёЁ]', text) is not None
+    # Memoized: the same raw strings and fragments are checked several times
+    # (pre-filtering, parsing, token filtering), so scan each one only once.
+    return _RUSSIAN_RE.search(text) is not None
 
 def is_internet_connected(url="http://www.google.com", timeout=3):
     try:
@@ -42,19 +181,23 @@ def is_internet_connected(url="http://www.google.com", timeout=3):
 def wait_for_internet(check_interval=5):
     print("Waiting for internet connection...")
     while not is_internet_connected():
-        time.sleep(check_interval)
+        if _shutdown_event.wait(check_interval):
+            return
     print("✅ Internet connected. Resuming...")
 
 def translate_single_text(text, pbar):
-    if not text or not text.strip():
+    # Nothing to translate: blank input, or no Russian left in it — return it
+    # unchanged without spending an HTTP round-trip.
+    if not text or not text.strip() or not contains_russian(text):
         return text
 
     max_retries = 5
     retry_delay = 3
     for attempt in range(max_retries):
+        if _shutdown_event.is_set():
+            return text
         try:
-            translator = GoogleTranslator(source='ru', target='en')
-            translated_text = translator.translate(text)
+            translated_text = get_translator().translate(text)
 
             # Clean up potential HTML entities from the result
             if translated_text:
@@ -69,40 +212,76 @@ def translate_single_text(text, pbar):
             if any(err in str(e) for err in ["Failed to establish a new connection", "Name or service not known"]):
                 wait_for_internet()
             else:
-                time.sleep(retry_delay)
+                _shutdown_event.wait(retry_delay)
+
+    if _shutdown_event.is_set():
+        return text
 
     pbar.write(f"\n❌ Failed to translate '{text[:30]}...' after {max_retries} attempts.")
     with open(FAILED_LOG, "a", encoding="utf-8") as f:
         f.write(text + "\n")
-    return text 
+    return text
+
+def translate_chunk(texts, pbar):
+    # Translate a whole chunk of fragments in one HTTP request instead of
+    # one round-trip per fragment.
+    if not texts:
+        return []
+
+    max_retries = 5
+    retry_delay = 3
+    for attempt in range(max_retries):
+        if _shutdown_event.is_set():
+            return list(texts)
+        try:
+            results = get_translator().translate_batch(texts)
+
+            # Clean up potential HTML entities, falling back to the original
+            # text when the API returns an empty result.
+            return [html.unescape(t) if t else original for t, original in zip(results, texts)]
+
+        except Exception as e:
+            pbar.write(f"\nBatch translation error ({len(texts)} fragments): {e} | Retrying {attempt + 1}/{max_retries}")
+            if any(err in str(e) for err in ["Failed to establish a new connection", "Name or service not known"]):
+                wait_for_internet()
+            else:
+                _shutdown_event.wait(retry_delay)
+
+    if _shutdown_event.is_set():
+        return list(texts)
+
+    # The batch call keeps failing; translate fragment by fragment so that a
+    # single bad string cannot poison the whole chunk.
+    pbar.write(f"\nBatch translation failed after {max_retries} attempts. Falling back to per-fragment translation...")
+    return [translate_single_text(text, pbar) for text in texts]
 
 def process_strings_semantically(all_strings_raw, cache, pbar_main):
+    """Translate a batch of raw strings and record the results in `cache`.
 
-    code_pattern = re.compile(
-        r"(\{[\w#]+\})"              # (1) {COLOR} codes
-        r"|(\%[-.\d]*[sdifucU\%])"  # (2) Format specifiers (%s, %d)
-        r"|(\\[ntbrfva\"'\\{} ])"    # (3) Pawn escape sequences (\n, \t, \\)
-        r"|(\\\r?\n)"                # (4) C-style line continuation
-        r"|(\s{2,})"                 # (5) Multiple spaces
-        r"|(\r)"                     # (6) Standalone carriage return
-        r"|(\n)"                     # (7) Standalone newline
-    )
+    Callers must pass only strings that are not already in `cache` (the main
+    loop filters against the cache once up front); they are not re-checked here.
+    """
 
     strings_to_translate_map = {}
 
     # 2. Parse strings to extract text fragments
     for raw_string in all_strings_raw:
-        # Only process strings not already in cache that contain Russian characters
-        if raw_string not in cache and contains_russian(raw_string):
-            tokens = code_pattern.split(raw_string)
-            valid_tokens = [t for t in tokens if t is not None and t != '']
-
-            text_fragments = [t for t in valid_tokens if not code_pattern.fullmatch(t) and contains_russian(t)]
+        # Only process strings that contain Russian characters
+        if contains_russian(raw_string):
+            # Plain sentence with no codes/escapes: the whole string is the
+            # single fragment, no need to split it apart and re-join it.
+            if not _CODE_RE.search(raw_string):
+                strings_to_translate_map[raw_string] = [raw_string]
+                continue
+
+            tokens = _CODE_RE.split(raw_string)
+            text_fragments = [t for i, t in enumerate(tokens)
+                              if i % _CODE_SLOTS == 0 and t and contains_russian(t)]
 
             if text_fragments:
                 strings_to_translate_map[raw_string] = text_fragments
 
-    unique_texts_to_translate = list(dict.fromkeys([item for sublist in strings_to_translate_map.values() for item in sublist]))
+    unique_texts_to_translate = list(dict.fromkeys(chain.from_iterable(strings_to_translate_map.values())))
 
     if not unique_texts_to_translate:
         pbar_main.write("No new Russian texts found to translate in this batch.")
@@ -113,28 +292,35 @@ def process_strings_semantically(all_strings_raw, cache, pbar_main):
     # 4. Translate fragments
     translation_map = {}
     new_translations_count = 0
+    chunks = [unique_texts_to_translate[i:i + TRANSLATE_CHUNK_SIZE]
+              for i in range(0, len(unique_texts_to_translate), TRANSLATE_CHUNK_SIZE)]
+
     with tqdm(total=len(unique_texts_to_translate), desc="Translating fragments", unit="frag") as pbar_translate:
-        for text in unique_texts_to_translate:
-            translated_text = translate_single_text(text, pbar_translate)
-            translation_map[text] = translated_text
-            new_translations_count += 1
-            pbar_translate.update(1)
+        with ThreadPoolExecutor(max_workers=WORKERS) as executor:
+            futures = {executor.submit(translate_chunk, chunk, pbar_translate): chunk for chunk in chunks}
+            for future in as_completed(futures):
+                chunk = futures[future]
+                for text, translated_text in zip(chunk, future.result()):
+                    translation_map[text] = translated_text
+                    new_translations_count += 1
+                    pbar_translate.update(1)
 
     # 5. Reconstruct the original strings and apply AI cleanup
-    for raw_string in strings_to_translate_map.keys():
-        reconstructed_string = ""
-        tokens = [t for t in code_pattern.split(raw_string) if t is not None and t != '']
+    for raw_string, text_fragments in strings_to_translate_map.items():
+        if text_fragments == [raw_string]:
+            # The string was a single fragment; no split/re-join needed.
+            reconstructed_string = translation_map.get(raw_string, raw_string)
+        else:
+            reconstructed_string = ""
+            tokens = [t for t in _CODE_RE.split(raw_string) if t is not None and t != '']
 
-        for token in tokens:
-            reconstructed_string += translation_map.get(token, token)
+            for token in tokens:
+                reconstructed_string += translation_map.get(token, token)
 
-        reconstructed_string = re.sub(r'\\?\s*\r?\n\s*', ' ', reconstructed_string)
-        
-        reconstructed_string = re.sub(r' +\n', r'\n', reconstructed_string)
+        reconstructed_string = _NEWLINE_COLLAPSE_RE.sub(' ', reconstructed_string)
 
         # --- Post-processing after reconstruction ---
-        reconstructed_string = re.sub(r'([a-zA-Zа-яА-ЯёЁ])(%[-.\d]*[sdifucU%])', r'\1 \2', reconstructed_string)
-        reconstructed_string = re.sub(r'(%[-.\d]*[sdifucU%])([a-zA-Zа-яА-ЯёЁ])', r'\1 \2', reconstructed_string)
+        reconstructed_string = _FMT_RE.sub(_fmt_spacing, reconstructed_string)
 
         cache[raw_string] = reconstructed_string
         pbar_main.update(1)
@@ -142,48 +328,34 @@ def process_strings_semantically(all_strings_raw, cache, pbar_main):
     return cache, new_translations_count
 
 
+# Finished Pawn string literals ('"..."', already escaped), keyed by the
+# original string content. Translations never change once cached, so escaping
+# is done at most once per string no matter how often the output is regenerated.
+_escaped_cache = {}
+
 def generate_output_file(original_content, cache, pattern_obj, output_filepath):
     def replace_from_cache(match):
         if match.group(2) is not None: # It's a string literal
             original_string_content = match.group(2)
-            translated_content = cache.get(original_string_content)
-
-            if translated_content is not None:
-                escaped_for_pawn = ""
-                i = 0
-                while i < len(translated_content):
-                    char = translated_content[i]
-                    if char == '\\':
-                        # Check if it's an existing Pawn escape sequence or a literal backslash that needs escaping.
-                        # This list should cover all valid single-backslash escapes in Pawn.
-                        if i + 1 < len(translated_content) and translated_content[i+1] in ['n', 't', 'b', 'r', 'f', 'v', 'a', '"', '\'', '\\', '%', '{', '}',' ']:
-                            # It's an already correct Pawn escape sequence, keep it as is.
-                            # The regex in process_strings_semantically should ensure these are treated as single tokens.
-                            # If the translator returns something like "text\nmore", we should keep it.
-                            escaped_for_pawn += char + translated_content[i+1]
-                            i += 1 # Skip the next char as it's part of the escape
-                        else:
-                            # It's a literal backslash not part of a recognized escape, needs to be \\
-                            # Example: If translated_content has "C:\path", this '\' needs to be '\\'
-                            # Or if original text had a literal '\' that wasn't a Pawn escape, and the translator kept it.
-                            escaped_for_pawn += '\\\\'
-                    elif char == '"':
-                        # Literal double quote, always needs to be \"
-                        escaped_for_pawn += '\\"'
-                    else:
-                        # Regular character, add as is
-                        escaped_for_pawn += char
-                    i += 1
-
-                return f'"{escaped_for_pawn}"'
-            else:
-                return match.group(1)
+            escaped = _escaped_cache.get(original_string_content)
+
+            if escaped is None:
+                translated_content = cache.get(original_string_content)
+                if translated_content is None:
+                    return match.group(1)
+                escaped = f'"{_pawn_escape(translated_content)}"'
+                _escaped_cache[original_string_content] = escaped
+
+            return escaped
 
         return match.group(0)
 
     translated_content = pattern_obj.sub(replace_from_cache, original_content)
-    with open(output_filepath, "w", encoding="cp1251", errors='replace') as f:
-        f.write(translated_content)
+    # Encode once and write the bytes directly instead of going through a
+    # text-mode wrapper that buffers a second full-size copy.
+    data = translated_content.encode("cp1251", errors='replace')
+    with open(output_filepath, "wb") as f:
+        f.write(data)
 
 if __name__ == "__main__":
     try:
@@ -205,11 +377,13 @@ if __name__ == "__main__":
         with open(INPUT_FILE, "r", encoding="cp1251", errors='replace') as f:
             original_content = f.read()
 
-        translation_cache = load_json_file(CACHE_FILE)
+        translation_cache = replay_cache_journal(load_json_file(CACHE_FILE))
 
         print("Extracting all string literals...")
-        all_strings_raw = [match.group(2) for match in string_or_comment_pattern.finditer(original_content) if match.group(2) is not None]
-        unique_raw_strings = list(dict.fromkeys(all_strings_raw))
+        unique_raw_strings = list(dict.fromkeys(
+            match.group(2) for match in string_or_comment_pattern.finditer(original_content)
+            if match.group(2) is not None
+        ))
 
         strings_needing_translation = [s for s in unique_raw_strings if s not in translation_cache and contains_russian(s)]
 
@@ -226,37 +400,64 @@ if __name__ == "__main__":
                 print(f"Translation limit applied: Only {len(strings_needing_translation)} strings will be processed.")
 
             total_strings_to_process = len(strings_needing_translation)
-            
+
 
             translated_in_current_session_count = 0
-            
-            for i in range(0, total_strings_to_process, 1): 
-                current_string = strings_needing_translation[i]
-
-                if current_string not in translation_cache:
-                    print(f"\n--- Processing string {i + 1}/{total_strings_to_process} ---")
-                    
-                    with tqdm(total=1, desc="Processing string", unit="string") as pbar:
-                        translation_cache, new_translations_in_batch = process_strings_semantically([current_string], translation_cache, pbar)
-                    
-                    translated_in_current_session_count += new_translations_in_batch
-
-                    if translated_in_current_session_count >= BATCH_SIZE:
-                        print(f"\n{translated_in_current_session_count} new translations achieved. Saving updated cache to disk...")
-                        save_json_file(CACHE_FILE, translation_cache)
-
-                        print(f"\nGenerating output file with current translations...")
-                        generate_output_file(original_content, translation_cache, string_or_comment_pattern, OUTPUT_FILE)
-                        translated_in_current_session_count = 0
-
-
-            # After the loop, save any remaining translations that didn't form a full batch
-            if translated_in_current_session_count > 0:
-                print(f"\nSaving final {translated_in_current_session_count} remaining translations to disk...")
-                save_json_file(CACHE_FILE, translation_cache)
-                print(f"\nGenerating final output file with all translations...")
+            session_had_new_translations = False
+            session_flushed = False
+            pending_journal_entries = {}
+
+            def flush_session():
+                # Compact the cache and write the output file exactly once,
+                # whether the run finishes normally, is interrupted with
+                # Ctrl+C, or dies on an unhandled error.
+                global session_flushed
+                if session_flushed:
+                    return
+                session_flushed = True
+
+                append_cache_journal(pending_journal_entries)
+                if session_had_new_translations or os.path.exists(CACHE_JOURNAL):
+                    print(f"\nCompacting translation cache to disk...")
+                    compact_cache(translation_cache)
+                print(f"\nGenerating output file with all translations...")
                 generate_output_file(original_content, translation_cache, string_or_comment_pattern, OUTPUT_FILE)
 
+            def handle_sigint(signum, frame):
+                # Tell the worker threads to bail out of their retry/wait
+                # loops so executor shutdown cannot hang, then exit through
+                # the normal path so the atexit flush still runs.
+                _shutdown_event.set()
+                sys.exit(130)
+
+            atexit.register(flush_session)
+            signal.signal(signal.SIGINT, handle_sigint)
+
+            for i in range(0, total_strings_to_process, BATCH_SIZE):
+                batch = strings_needing_translation[i:i + BATCH_SIZE]
+                print(f"\n--- Processing strings {i + 1}-{i + len(batch)}/{total_strings_to_process} ---")
+
+                with tqdm(total=len(batch), desc="Processing strings", unit="string") as pbar:
+                    translation_cache, new_translations_in_batch = process_strings_semantically(batch, translation_cache, pbar)
+
+                for batch_string in batch:
+                    if batch_string in translation_cache:
+                        pending_journal_entries[batch_string] = translation_cache[batch_string]
+
+                translated_in_current_session_count += new_translations_in_batch
+                session_had_new_translations = session_had_new_translations or new_translations_in_batch > 0
+
+                if translated_in_current_session_count >= BATCH_SIZE:
+                    print(f"\n{translated_in_current_session_count} new translations achieved. Appending them to the cache journal...")
+                    append_cache_journal(pending_journal_entries)
+                    pending_journal_entries = {}
+                    translated_in_current_session_count = 0
+
+
+            # After the loop, fold this session's translations into the base cache
+            # and write the output file (also runs via atexit on interruption).
+            flush_session()
+
 
         print(f"\nProcess completed successfully. The final file is located at:")
         print(f"File path: {OUTPUT_FILE}")